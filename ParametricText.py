@@ -25,15 +25,19 @@
 # SOFTWARE.
 
 import adsk.core, adsk.fusion, adsk.cam, traceback
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
 import enum
 import datetime
-import queue
+import functools
 import re
 import math
+import sys
 
 NAME = 'ParametricText'
 
+# The lib modules are only stale if the add-in has been loaded before
+reload_lib_ = f'{__package__}.thomasa88lib' in sys.modules
+
 try:
     # Must import lib as unique name, to avoid collision with other versions
     # loaded by other add-ins
@@ -51,12 +55,13 @@ except ImportError as e:
     raise
 
 # Force modules to be fresh during development
-import importlib
-importlib.reload(thomasa88lib.utils)
-importlib.reload(thomasa88lib.events)
-importlib.reload(thomasa88lib.manifest)
-importlib.reload(thomasa88lib.error)
-importlib.reload(thomasa88lib.settings)
+if reload_lib_:
+    import importlib
+    importlib.reload(thomasa88lib.utils)
+    importlib.reload(thomasa88lib.events)
+    importlib.reload(thomasa88lib.manifest)
+    importlib.reload(thomasa88lib.error)
+    importlib.reload(thomasa88lib.settings)
 
 from . import paramparser
 from . import paramformatter
@@ -71,6 +76,28 @@ ERROR_CMD_ID = 'thomasa88_ParametricText_ErrorNotification'
 # user parameters in Fusion, you should likely write a script from scratch instead of
 # trying to patch together two scripts/add-ins ;).
 EXT_UPDATE_EVENT_ID = 'thomasa88_ParametricText_Ext_Update'
+# Fields to update when a Fusion command completes, by command ID. None means all
+# fields. A dict, as command_terminated_handler() looks up every command.
+COMMAND_TEXT_FILTERS = {
+    # User (might have) changed a parameter
+    'ChangeParameterCommand': None,
+    'SketchEditDimensionCmdDef': None,
+    'DesignConfigurationActivateRowCmd': None,
+    # User pasted a component, that will have a new name
+    'FusionPasteNewCommand': ('_.component',),
+    # User changed component properties
+    'FusionPropertiesCommand': ('_.component', '_.compdesc', '_.partnum')
+}
+# Commands whose affected fields depend on the selected entity
+RENAME_CMD_IDS = frozenset([
+    'RenameCommand',
+    'FusionRenameTimelineEntryCommand'
+])
+# Fields affected by renaming an entity, by entity type
+RENAME_TEXT_FILTERS = {
+    adsk.fusion.Occurrence.classType(): '_.component',
+    adsk.fusion.Sketch.classType(): '_.sketch'
+}
 PANEL_IDS = [
             'SketchModifyPanel',
             'SolidModifyPanel',
@@ -96,6 +123,7 @@ QUICK_REF_LINES = QUICK_REF.count('<br>')
 # parameters stored in the document.
 STORAGE_VERSION = 2
 ATTRIBUTE_GROUP = 'thomasa88_ParametricText'
+HAS_TEXT_ATTR_PATTERN = r're:hasText_\d+'
 
 AUTOCOMPUTE_SETTING = 'autocompute'
 
@@ -103,10 +131,17 @@ class DialogState:
     def __init__(self):
         self.last_selected_row = None
         self.addin_updating_select = False
-        self.removed_texts = []
+        self.removed_texts = set()
+        # Texts created in this dialog session. These have no attributes to clean up.
+        self.added_texts = set()
         # Keep a list of unselects, to handle user unselecting multiple at once (window selection)
         self.pending_unselects = []
         self.insert_button_values = []
+        # (sketch_texts_input, value_input) for each row, by text ID
+        self.row_inputs = {}
+        # Coalesce select input updates triggered by multiple input changes (e.g. typing)
+        self.select_update_pending = False
+        self.select_update_force = False
 
 class InsertButtonValue:
     def __init__(self, value, prepend=False):
@@ -116,6 +151,12 @@ class InsertButtonValue:
 app_ = None
 ui_ = None
 
+# Command definitions that are executed often. Kept to not have to look them up.
+update_cmd_def_ = None
+error_cmd_def_ = None
+# Our toolbar controls, kept for clean-up in stop()
+map_cmd_controls_ = []
+
 manifest_ = thomasa88lib.manifest.read()
 
 NAME_VERSION = f'{NAME} v {manifest_["version"]}'
@@ -131,7 +172,8 @@ settings_ = thomasa88lib.settings.SettingsManager({
 # This dict must be reset every time the dialog is opened,
 # as the user might have cancelled it the last time.
 # The list for each row cannot be a set(), as SketchText is not hashable.
-dialog_selection_map_ = defaultdict(list)
+# Rows without any selections do not need to have an entry.
+dialog_selection_map_ = {}
 
 # It seems that attributes are not saved until the command is executed,
 # so we must keep the ID in a buffer, to keep track correctly
@@ -158,6 +200,8 @@ text_height_workaround_state_ = WorkaroundState.Disabled
 def run(context):
     global app_
     global ui_
+    global update_cmd_def_
+    global error_cmd_def_
     with error_catcher_:
         app_ = adsk.core.Application.get()
         ui_ = app_.userInterface
@@ -199,7 +243,9 @@ def run(context):
             old_control = panel.controls.itemById(MAP_CMD_ID)
             if old_control:
                 old_control.deleteMe()
-            panel.controls.addCommand(map_cmd_def, 'ChangeParameterCommand', False)
+            map_cmd_controls_.append(panel.controls.addCommand(map_cmd_def,
+                                                               'ChangeParameterCommand',
+                                                               False))
 
         events_manager_.add_handler(app_.documentSaving, callback=document_saving_handler)
         events_manager_.add_handler(ui_.commandTerminated, callback=command_terminated_handler)
@@ -213,6 +259,7 @@ def run(context):
         update_cmd_def = ui_.commandDefinitions.addButtonDefinition(UPDATE_CMD_ID, 'Calculate Text Parameters', '')
         events_manager_.add_handler(update_cmd_def.commandCreated,
                                     callback=update_cmd_created_handler)
+        update_cmd_def_ = update_cmd_def
 
         error_cmd_def = ui_.commandDefinitions.itemById(ERROR_CMD_ID)
         if error_cmd_def:
@@ -220,13 +267,14 @@ def run(context):
         error_cmd_def = ui_.commandDefinitions.addButtonDefinition(ERROR_CMD_ID, 'Show error', '')
         events_manager_.add_handler(error_cmd_def.commandCreated,
                                     callback=error_cmd_created_handler)
+        error_cmd_def_ = error_cmd_def
         
         delayed_event = events_manager_.register_event(EXT_UPDATE_EVENT_ID)
         events_manager_.add_handler(delayed_event, callback=ext_call_update_handler)
 
         if app_.isStartupComplete and is_design_workspace():
             # Add-in was (re)loaded while Fusion 360 was running
-            check_storage_version()
+            check_storage_version(app_.activeProduct)
 
 def stop(context):
     if not started_:
@@ -235,13 +283,12 @@ def stop(context):
     with error_catcher_:
         events_manager_.clean_up()
 
-        for panel_id in PANEL_IDS:
-            panel = ui_.allToolbarPanels.itemById(panel_id)
-            control = panel.controls.itemById(MAP_CMD_ID)
-            if control:
+        for control in map_cmd_controls_:
+            if control.isValid:
                 control.deleteMe()
-        
-        map_cmd_def = panel.controls.itemById(MAP_CMD_ID)
+        map_cmd_controls_.clear()
+
+        map_cmd_def = ui_.commandDefinitions.itemById(MAP_CMD_ID)
         if map_cmd_def:
             map_cmd_def.deleteMe()
 
@@ -254,7 +301,7 @@ def map_cmd_created_handler(args: adsk.core.CommandCreatedEventArgs):
     design: adsk.fusion.Design = app_.activeProduct
 
     if not enabled_:
-        if not check_storage_version():
+        if not check_storage_version(design):
             return
 
     # Reset dialog state
@@ -324,22 +371,26 @@ def map_cmd_created_handler(args: adsk.core.CommandCreatedEventArgs):
     table_button_spacer2.isEnabled = False
     table_input.addToolbarCommandInput(table_button_spacer2)
 
-    add_insert_button(table_input, InsertButtonValue('{_.version}'), 'Append the document version parameter.')
+    # Share document values between the tooltips, to only fetch them once
+    context = EvaluationContext(design)
+    add_insert_button(table_input, InsertButtonValue('{_.version}'), 'Append the document version parameter.',
+                      context=context)
     # Suggest som user parameters
     for i, param in enumerate(reversed(design.userParameters)):
         if i == 2:
             break
-        short_name = truncate_text(param.name, 6)
+        param_name = param.name
+        short_name = truncate_text(param_name, 6)
         label = f'{{{short_name}}}'
-        insert_text = f'{{{param.name}}}'
+        insert_text = f'{{{param_name}}}'
         add_insert_button(table_input, InsertButtonValue(insert_text),
-                          f'Append the <i>{param.name}</i> parameter, with default formatting.',
-                          different_label=label)
+                          f'Append the <i>{param_name}</i> parameter, with default formatting.',
+                          different_label=label, context=context)
         label_0f = f'{{{short_name}:.0f}}'
-        insert_text_0f = f'{{{param.name}:.0f}}'
+        insert_text_0f = f'{{{param_name}:.0f}}'
         add_insert_button(table_input, InsertButtonValue(insert_text_0f),
-                          f'Append the <i>{param.name}</i> parameter, with no decimals.',
-                          different_label=label_0f)
+                          f'Append the <i>{param_name}</i> parameter, with no decimals.',
+                          different_label=label_0f, context=context)
     
     # The select events cannot work without having an active SelectionCommandInput
     select_input = cmd.commandInputs.addSelectionInput('select', 'Sketch Texts', '')
@@ -364,7 +415,7 @@ def truncate_text(text, length):
 
 def add_insert_button(table_input, insert_value, tooltip,
                       tooltip_description='', evaluate=True, different_label=None,
-                      prepend=False, resourceFolder=''):
+                      prepend=False, resourceFolder='', context=None):
     button_id = f'insert_btn_{len(dialog_state_.insert_button_values)}'
     dialog_state_.insert_button_values.append(insert_value)
     if different_label:
@@ -374,7 +425,7 @@ def add_insert_button(table_input, insert_value, tooltip,
 
     if evaluate:
         ## TODO: evaluate_text should handle sketch_text=None gracefully
-        tooltip += '<br><br>Current value: ' + evaluate_text(insert_value.value, None)
+        tooltip += '<br><br>Current value: ' + evaluate_text(insert_value.value, None, context)
 
     button = table_input.commandInputs.addBoolValueInput(button_id, label, False, resourceFolder, True)
     button.tooltip = tooltip
@@ -385,9 +436,7 @@ def add_insert_button(table_input, insert_value, tooltip,
 
 def map_cmd_input_changed_handler(args: adsk.core.InputChangedEventArgs):
     global dialog_selection_map_
-    design: adsk.fusion.Design = app_.activeProduct
     table_input: adsk.core.TableCommandInput = args.inputs.itemById('table')
-    select_input = args.inputs.itemById('select')
     need_update_select_input = False
     update_select_force = False
     text_id = get_text_id(args.input)
@@ -403,7 +452,7 @@ def map_cmd_input_changed_handler(args: adsk.core.InputChangedEventArgs):
             insert_id = int(args.input.id.split('_')[-1])
             insert_value = dialog_state_.insert_button_values[insert_id]
             text_id = get_text_id(table_input.getInputAtPosition(row, 0))
-            value_input = table_input.commandInputs.itemById(f'value_{text_id}')
+            _, value_input = dialog_state_.row_inputs[text_id]
             if insert_value.prepend:
                 value_input.value = insert_value.value + value_input.value
             else:
@@ -413,8 +462,8 @@ def map_cmd_input_changed_handler(args: adsk.core.InputChangedEventArgs):
     elif args.input.id.startswith('sketchtexts_'):
         need_update_select_input = True
     elif args.input.id.startswith('clear_btn_'):
-        sketch_texts_input = table_input.commandInputs.itemById(f'sketchtexts_{text_id}')
-        sketch_texts = dialog_selection_map_[text_id]
+        sketch_texts_input, _ = dialog_state_.row_inputs[text_id]
+        sketch_texts = dialog_selection_map_.setdefault(text_id, [])
         sketch_texts.clear()
         set_row_sketch_texts_text(sketch_texts_input, sketch_texts)
         need_update_select_input = True
@@ -424,7 +473,11 @@ def map_cmd_input_changed_handler(args: adsk.core.InputChangedEventArgs):
 
     if need_update_select_input:
         # Wait for the table row selection to update before updating select input
-        events_manager_.delay(lambda: update_select_input(table_input, update_select_force))
+        dialog_state_.select_update_force |= update_select_force
+        if not dialog_state_.select_update_pending:
+            dialog_state_.select_update_pending = True
+            state = dialog_state_
+            events_manager_.delay(lambda: delayed_update_select_input(table_input, state))
 
 def map_cmd_pre_select_handler(args: adsk.core.SelectionEventArgs):
     # Select all proxies pointing to the same SketchText
@@ -460,9 +513,9 @@ def handle_select_input_change(table_input):
 
     select_input = command_.commandInputs.itemById('select')
     text_id = get_text_id(table_input.getInputAtPosition(row, 0))
-    sketch_texts_input = table_input.commandInputs.itemById(f'sketchtexts_{text_id}')
+    sketch_texts_input, _ = dialog_state_.row_inputs[text_id]
     
-    sketch_texts = dialog_selection_map_[text_id]
+    sketch_texts = dialog_selection_map_.setdefault(text_id, [])
     sketch_texts.clear()
     pending_unselect_sketch_texts = [get_native_sketch_text(u)
                                      for u in dialog_state_.pending_unselects]
@@ -487,6 +540,12 @@ def handle_select_input_change(table_input):
         # so we rebuild the selection list instead.
         update_select_input(table_input, force=True)
 
+def delayed_update_select_input(table_input, state):
+    force = state.select_update_force
+    state.select_update_pending = False
+    state.select_update_force = False
+    update_select_input(table_input, force)
+
 def update_select_input(table_input, force=False):
     if not table_input.isValid:
         # Dialog is likely closed. This is an effect of the delay() call.
@@ -500,7 +559,7 @@ def update_select_input(table_input, force=False):
         select_input.clearSelection()
         if row != -1:
             text_id = get_text_id(table_input.getInputAtPosition(row, 0))
-            for sketch_text in dialog_selection_map_[text_id]:
+            for sketch_text in dialog_selection_map_.get(text_id, ()):
                 # "This method is not valid within the commandCreated event but must be used later
                 # in the command lifetime. If you want to pre-populate the selection when the
                 # command is starting, you can use this method in the activate method of the Command."
@@ -528,46 +587,36 @@ def get_sketch_text_proxies(native_sketch_text):
         # Root level sketch. There are no occurences and there will be no proxies.
         return [native_sketch_text]
 
-    sketch_text_proxies = []
-    for occurrence in in_occurrences:
-        sketch_proxy = native_sketch.createForAssemblyContext(occurrence)
-        sketch_text_proxy = find_equal_sketch_text(sketch_proxy, native_sketch_text)
-        sketch_text_proxies.append(sketch_text_proxy)
-    return sketch_text_proxies
+    # The text has the same index in all proxies of the sketch
+    text_index = find_sketch_text_index(native_sketch_text)
+    return [native_sketch.createForAssemblyContext(occurrence).sketchTexts.item(text_index)
+            for occurrence in in_occurrences]
 
 def find_equal_sketch_text(in_sketch, sketch_text):
     '''Used when mapping proxy <--> native'''
+    return in_sketch.sketchTexts.item(find_sketch_text_index(sketch_text))
+
+def find_sketch_text_index(sketch_text):
     # Workaround for missing SketchText.nativeObject
     # Bug: https://forums.autodesk.com/t5/fusion-360-api-and-scripts/getting-nativeobject-for-sketchtext/td-p/9782524
 
     # Assuming the texts will be returned in the same order
     # from both proxy and native sketch.
-    text_index = 0
     for i, st in enumerate(sketch_text.parentSketch.sketchTexts):
         if st == sketch_text:
-            text_index = i
-            break
-    else:
-        ui_.messageBox(f'Failed to translate sketch text proxy (component instance) to native text object.\n\n'
-                        'Please inform the developer of what steps you performed to trigger this error.',
-                        NAME_VERSION)
-    return in_sketch.sketchTexts.item(text_index)
+            return i
+    ui_.messageBox(f'Failed to translate sketch text proxy (component instance) to native text object.\n\n'
+                    'Please inform the developer of what steps you performed to trigger this error.',
+                    NAME_VERSION)
+    return 0
 
 def set_row_sketch_texts_text(sketch_texts_input, sketch_texts):
     if sketch_texts:
-        total_count = 0
-        count_per_sketch = defaultdict(int)
-        for sketch_text in sketch_texts:
-            # Name is unique
-            count_per_sketch[sketch_text.parentSketch.name] += 1
-            total_count += 1
-        display_names = []
-        for sketch_name, count in count_per_sketch.items():
-            display_name = sketch_name
-            if count > 1:
-                display_name += f' ({count})'
-            display_names.append(display_name)
-        value = ', '.join(sorted(display_names))
+        total_count = len(sketch_texts)
+        # Name is unique
+        count_per_sketch = Counter(sketch_text.parentSketch.name for sketch_text in sketch_texts)
+        value = ', '.join(sorted(sketch_name if count == 1 else f'{sketch_name} ({count})'
+                                 for sketch_name, count in count_per_sketch.items()))
         # Indicate if not all selections are visible. Show all in tooltip.
         if total_count > 2:
             sketch_texts_input.value = f'[{total_count}] {value}'
@@ -579,15 +628,14 @@ def set_row_sketch_texts_text(sketch_texts_input, sketch_texts):
         sketch_texts_input.tooltip = ''
 
 def get_text_id(input_or_str):
-    if isinstance(input_or_str, adsk.core.CommandInput):
+    if not isinstance(input_or_str, str):
+        # CommandInput
         input_or_str = input_or_str.id
-    return input_or_str.split('_')[-1]
+    return input_or_str.rpartition('_')[2]
 
 def add_row(table_input, text_id, new_row=True, text=None):
     global dialog_selection_map_
-    design: adsk.fusion.Design = app_.activeProduct
-
-    sketch_texts = dialog_selection_map_[text_id]
+    sketch_texts = dialog_selection_map_.get(text_id, ())
 
     row_index = table_input.rowCount
 
@@ -607,8 +655,10 @@ def add_row(table_input, text_id, new_row=True, text=None):
     table_input.addCommandInput(sketch_texts_input, row_index, 0)
     table_input.addCommandInput(clear_selection_input, row_index, 1)
     table_input.addCommandInput(value_input, row_index, 2)
+    dialog_state_.row_inputs[str(text_id)] = (sketch_texts_input, value_input)
     
     if new_row:
+        dialog_state_.added_texts.add(str(text_id))
         table_input.selectedRow = row_index
         select_input = table_input.parentCommand.commandInputs.itemById('select')
         select_input.clearSelection()
@@ -616,7 +666,8 @@ def add_row(table_input, text_id, new_row=True, text=None):
 def remove_row(table_input: adsk.core.TableCommandInput, row_index):
     text_id = get_text_id(table_input.getInputAtPosition(row_index, 0))
     table_input.deleteRow(row_index)
-    dialog_state_.removed_texts.append(text_id)
+    del dialog_state_.row_inputs[text_id]
+    dialog_state_.removed_texts.add(text_id)
     if table_input.rowCount > row_index:
         table_input.selectedRow = row_index
     else:
@@ -636,34 +687,41 @@ def map_cmd_execute_handler(args: adsk.core.CommandEventArgs):
     save(cmd)
 
 def save(cmd):
-    table_input: adsk.core.TableCommandInput = cmd.commandInputs.itemById('table')
     design: adsk.fusion.Design = app_.activeProduct
 
-    save_storage_version()
+    save_storage_version(design)
 
-    if not save_next_id():
+    if not save_next_id(design):
         return
 
     # TODO: Use this text map the whole time - instead of dialog_selection_map_
     texts = defaultdict(TextInfo)
-    for row_index in range(table_input.rowCount):
-        text_id = get_text_id(table_input.getInputAtPosition(row_index, 0))
-        sketch_texts = dialog_selection_map_[text_id]
-        text = table_input.commandInputs.itemById(f'value_{text_id}').value
-
+    for text_id, (_, value_input) in dialog_state_.row_inputs.items():
         text_info = texts[text_id]
-        text_info.text_value = text
-        text_info.sketch_texts = sketch_texts
-
-        remove_attributes(text_id)
+        text_info.text_value = value_input.value
+        text_info.sketch_texts = dialog_selection_map_.get(text_id, [])
 
-        design.attributes.add(ATTRIBUTE_GROUP, f'textValue_{text_id}', text)
-    
-        for sketch_text in sketch_texts:
-            sketch_text.attributes.add(ATTRIBUTE_GROUP, f'hasText_{text_id}', '')
+    # Clear all old attributes first and then write all new attributes in one go,
+    # instead of interleaving attribute lookups and writes for every row.
+    attr_index = index_text_attributes(design)
+    unchanged_values = set()
+    for text_id, text_info in texts.items():
+        for old_attr in attr_index.pop(text_id, []):
+            if (old_attr.name.startswith('textValue_') and
+                old_attr.value == text_info.text_value):
+                # No need to delete and re-add a value that has not changed
+                unchanged_values.add(text_id)
+            else:
+                old_attr.deleteMe()
+    for text_id in dialog_state_.removed_texts - dialog_state_.added_texts:
+        remove_attributes(text_id, attr_index)
 
-    for text_id in dialog_state_.removed_texts:
-        remove_attributes(text_id)
+    for text_id, text_info in texts.items():
+        if text_id not in unchanged_values:
+            design.attributes.add(ATTRIBUTE_GROUP, f'textValue_{text_id}', text_info.text_value)
+        has_attr_name = f'hasText_{text_id}'
+        for sketch_text in text_info.sketch_texts:
+            sketch_text.attributes.add(ATTRIBUTE_GROUP, has_attr_name, '')
 
     # Save some memory
     dialog_selection_map_.clear()
@@ -672,9 +730,7 @@ def save(cmd):
 
     update_texts(texts=texts)
 
-def save_storage_version():
-    design: adsk.fusion.Design = app_.activeProduct
-
+def save_storage_version(design):
     design.attributes.add(ATTRIBUTE_GROUP, 'storageVersion', str(STORAGE_VERSION))
 
     # Add a warning to v1.x.x users
@@ -683,9 +739,8 @@ def save_storage_version():
     design.attributes.add(ATTRIBUTE_GROUP, 'customTextValue_1', f'Please update {NAME}')
     design.attributes.add(ATTRIBUTE_GROUP, 'customTextType_1', 'custom')
 
-def save_next_id():
+def save_next_id(design):
     global dialog_next_id_
-    design: adsk.fusion.Design = app_.activeProduct
     next_id = dialog_next_id_
     print(f"{NAME} SAVE NEXT ID {next_id}")
     if next_id is None:
@@ -697,17 +752,29 @@ def save_next_id():
     dialog_next_id_ = None
     return True
 
-def remove_attributes(text_id):
-    design = app_.activeProduct
+def index_text_attributes(design):
+    '''Maps text IDs to all attributes stored for the texts.
 
-    old_attrs = design.findAttributes(ATTRIBUTE_GROUP, f'hasText_{text_id}')
-    for old_attr in old_attrs:
+    Scans the attributes once, instead of searching all attributes for every text ID.
+    '''
+    attr_index = defaultdict(list)
+    for value_attr in design.attributes.itemsByGroup(ATTRIBUTE_GROUP):
+        if value_attr.name.startswith('textValue_'):
+            attr_index[get_text_id(value_attr.name)].append(value_attr)
+    for has_attr in find_has_text_attributes(design):
+        attr_index[get_text_id(has_attr.name)].append(has_attr)
+    return attr_index
+
+def find_has_text_attributes(design):
+    '''Finds the attributes that map sketch texts to texts, for all texts.'''
+    # findAttributes() only does exact or regex matching on the name. The regex is
+    # matched inside Fusion, so it is cheaper than fetching every attribute name.
+    return design.findAttributes(ATTRIBUTE_GROUP, HAS_TEXT_ATTR_PATTERN)
+
+def remove_attributes(text_id, attr_index):
+    for old_attr in attr_index.pop(text_id, []):
         old_attr.deleteMe()
 
-    value_attr = design.attributes.itemByName(ATTRIBUTE_GROUP, f'textValue_{text_id}')
-    if value_attr:
-        value_attr.deleteMe()
-
 # Tries to update the given SketchText, if the text value has changed.
 # Returns True if the supplied text value differed from the old value.
 def set_sketch_text(sketch_text, text):
@@ -728,12 +795,13 @@ def set_sketch_text(sketch_text, text):
         global text_height_workaround_state_
         if text_height_workaround_state_ == WorkaroundState.Enabled:
             # Expecting parameter order to be stable inside our function scope
-            param_exprs = [p.expression for p in sketch_text.parentSketch.parentComponent.modelParameters]
+            params = list(sketch_text.parentSketch.parentComponent.modelParameters)
+            param_exprs = [p.expression for p in params]
 
         sketch_text.text = text
 
         if text_height_workaround_state_ == WorkaroundState.Enabled:
-            for orig_expr, param in zip(param_exprs, sketch_text.parentSketch.parentComponent.modelParameters):
+            for orig_expr, param in zip(param_exprs, params):
                 # Doubles! We should be able to check equality since we don't change the values
                 if param.expression != orig_expr:
                     param.expression = orig_expr
@@ -796,7 +864,8 @@ def check_text_height_bug(sketch_text):
 
     # Note: We must restore the expression when we are done!
 
-    orig_param_exprs = [p.expression for p in sketch_text.parentSketch.parentComponent.modelParameters]
+    params = list(sketch_text.parentSketch.parentComponent.modelParameters)
+    orig_param_exprs = [p.expression for p in params]
 
     # We don't know which parameter is connected to the SketchText, so we must fiddle with the SketcText
     # and observe
@@ -812,15 +881,117 @@ def check_text_height_bug(sketch_text):
     # we might be setting the value the user set initially.
 
     # Restore the parameter's expression (which might be more than a simple value)
-    for orig_expr, param in zip(orig_param_exprs, sketch_text.parentSketch.parentComponent.modelParameters):
+    for orig_expr, param in zip(orig_param_exprs, params):
         if param.expression != orig_expr:
             param.expression = orig_expr
             break
 
+class EvaluationContext:
+    '''Document values that are shared by all texts evaluated in one update pass.
+
+    The values are fetched on first use, as some of them are expensive to get.
+    '''
+    def __init__(self, design, next_version=False):
+        self.design = design
+        self.next_version = next_version
+        self._version = None
+        self._save_time = None
+        self._document_name = None
+        self._configuration_name = None
+        self._units_manager = None
+        self._parameters = {}
+
+    @property
+    def version(self):
+        if self._version is None:
+            # No version information available if the document is not saved
+            if app_.activeDocument.isSaved:
+                version = get_data_file().versionNumber
+            else:
+                version = 0
+            if self.next_version:
+                version += 1
+            self._version = version
+        return self._version
+
+    @property
+    def save_time(self):
+        '''Save time, in the local timezone'''
+        if self._save_time is None:
+            if self.next_version:
+                # The user is saving, grab the current time. It will probably be a few
+                # seconds before the actual save time, but that should be good enough.
+                # Note: We must do this update before the save happens, to get a correct
+                # value in the save and to avoid making the document modified after the
+                # save.
+                save_time = datetime.datetime.now(tz=datetime.timezone.utc)
+            elif app_.activeDocument.isSaved:
+                unix_time_utc = get_data_file().dateCreated
+                save_time = datetime.datetime.fromtimestamp(unix_time_utc,
+                                                            tz=datetime.timezone.utc)
+            else:
+                # Set a fake time until the document is saved for the first time
+                # Doing this in the user's timezone, to get midnight time correct.
+                now = datetime.datetime.now(tz=None)
+                save_time = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            self._save_time = save_time.astimezone()
+        return self._save_time
+
+    @property
+    def document_name(self):
+        '''Document name, without version suffix'''
+        if self._document_name is None:
+            ### Can we handle "Save as" or document copying?
+            # activeDocument.name and activeDocument.dataFile.name gives us the same
+            # value, except that the former exists and gives the value "Untitled" for
+            # unsaved documents.
+            document_name = app_.activeDocument.name
+            self._document_name = strip_document_version(document_name)
+        return self._document_name
+
+    @property
+    def configuration_name(self):
+        if self._configuration_name is None:
+            top_table = self.design.configurationTopTable
+            if top_table:
+                self._configuration_name = top_table.activeRow.name
+            else:
+                self._configuration_name = f'<No configuration>'
+        return self._configuration_name
+
+    @property
+    def units_manager(self):
+        if self._units_manager is None:
+            self._units_manager = self.design.fusionUnitsManager
+        return self._units_manager
+
+    def get_parameter(self, name):
+        '''Returns the parameter with the given name, or None if it does not exist'''
+        if name not in self._parameters:
+            self._parameters[name] = self.design.allParameters.itemByName(name)
+        return self._parameters[name]
+
+# Fields whose values depend on the sketch text that is being evaluated
+SKETCH_TEXT_FIELDS = ('_.component', '_.compdesc', '_.partnum', '_.sketch')
+
 SUBST_PATTERN = re.compile(r'{([^}]+)}')
 DOCUMENT_NAME_VERSION_PATTERN = re.compile(r' (?:v\d+|\(v\d+.*?\))$')
-def evaluate_text(text, sketch_text, next_version=False):
-    design: adsk.fusion.Design = app_.activeProduct
+
+@functools.lru_cache(maxsize=256)
+def strip_document_version(name):
+    # Name string looks like this:
+    # <name> v3
+    # <name> (v3~recovered)
+    # Strip the suffix
+    return DOCUMENT_NAME_VERSION_PATTERN.sub('', name)
+
+def evaluate_text(text, sketch_text, context=None):
+    if '{' not in text:
+        # Nothing to substitute
+        return text
+    if context is None:
+        context = EvaluationContext(app_.activeProduct)
+    design = context.design
     def sub_func(subst_match):
         # https://www.python.org/dev/peps/pep-3101/
         # https://docs.python.org/3/library/string.html#formatspec
@@ -852,14 +1023,7 @@ def evaluate_text(text, sketch_text, next_version=False):
 
         if var_name == '_':
             if member == 'version':
-                # No version information available if the document is not saved
-                if app_.activeDocument.isSaved:
-                    version = get_data_file().versionNumber
-                else:
-                    version = 0
-                if next_version:
-                    version += 1
-                value = version
+                value = context.version
             elif member == 'date':
                 # This will provide the date and time using the local timezone
                 # We don't have to delegate to strftime(), as .format() on datetime handles this!
@@ -869,31 +1033,11 @@ def evaluate_text(text, sketch_text, next_version=False):
                     options_sep = ':'
                     options = '%Y-%m-%d'
 
-                if next_version:
-                    # The user is saving, grab the current time. It will probably be a few
-                    # seconds before the actual save time, but that should be good enough.
-                    # Note: We must do this update before the save happens, to get a correct
-                    # value in the save and to avoid making the document modified after the
-                    # save.
-                    save_time = datetime.datetime.now(tz=datetime.timezone.utc)
-                elif app_.activeDocument.isSaved:
-                    unix_time_utc = get_data_file().dateCreated
-                    save_time = datetime.datetime.fromtimestamp(unix_time_utc,
-                                                                tz=datetime.timezone.utc)
-                else:
-                    # Set a fake time until the document is saved for the first time
-                    # Doing this in the user's timezone, to get midnight time correct.
-                    now = datetime.datetime.now(tz=None)
-                    save_time = now.replace(hour=0, minute=0, second=0, microsecond=0)
-
-                save_time_local = save_time.astimezone()
-                value = save_time_local
+                value = context.save_time
             elif member == 'component':
                 # RootComponent turns into the name of the document including version number
                 # Strip it, as with _.file
-                component_name = sketch_text.parentSketch.parentComponent.name
-                component_name = DOCUMENT_NAME_VERSION_PATTERN.sub('', component_name)
-                value = component_name
+                value = strip_document_version(sketch_text.parentSketch.parentComponent.name)
                 string_value = True
             elif member == 'compdesc':
                 value = sketch_text.parentSketch.parentComponent.description
@@ -902,17 +1046,7 @@ def evaluate_text(text, sketch_text, next_version=False):
                 value = sketch_text.parentSketch.parentComponent.partNumber
                 string_value = True
             elif member == 'file':
-                ### Can we handle "Save as" or document copying?
-                # activeDocument.name and activeDocument.dataFile.name gives us the same
-                # value, except that the former exists and gives the value "Untitled" for
-                # unsaved documents.
-                document_name = app_.activeDocument.name
-                # Name string looks like this:
-                # <name> v3
-                # <name> (v3~recovered)
-                # Strip the suffix
-                document_name = DOCUMENT_NAME_VERSION_PATTERN.sub('', document_name)
-                value = document_name
+                value = context.document_name
                 string_value = True
             elif member == 'sketch':
                 ### Is this useful? Let's users edit the texts directly in the Browser or Timeline, I guess.
@@ -921,16 +1055,12 @@ def evaluate_text(text, sketch_text, next_version=False):
             elif member == 'newline':
                 value = '\n'
             elif member == 'configuration':
-                top_table = design.configurationTopTable
-                if top_table:
-                    value = top_table.activeRow.name
-                else:
-                    value = f'<No configuration>'
+                value = context.configuration_name
                 string_value = True
             else:
                 return f'<Unknown member of {var_name}: {member}>'
         else:
-            param = design.allParameters.itemByName(var_name)
+            param = context.get_parameter(var_name)
             if param is None:
                 return f'<Unknown parameter: {var_name}>'
 
@@ -943,7 +1073,7 @@ def evaluate_text(text, sketch_text, next_version=False):
                     # Has unit.
                     # Rounding is done to get rid of small floating point value noise,
                     # that result in "almost-correct" numbers. (42.99999999999 -> 43)
-                    value = round(design.fusionUnitsManager.convert(param.value, "internalUnits", param.unit), 10)
+                    value = round(context.units_manager.convert(param.value, "internalUnits", param.unit), 10)
             elif member == 'comment':
                 value = param.comment
                 string_value = True
@@ -1045,20 +1175,20 @@ def probe_data_file():
 def load(cmd):
     global dialog_selection_map_
     table_input: adsk.core.TableCommandInput = cmd.commandInputs.itemById('table')
+    design: adsk.fusion.Design = app_.activeProduct
 
-    load_next_id()
+    load_next_id(design)
 
     dialog_selection_map_.clear()
-    texts = get_texts()
+    texts = get_texts(design)
 
     for text_id, text_info in texts.items():
         dialog_selection_map_[text_id] = text_info.sketch_texts
         add_row(table_input, text_id, new_row=False,
                 text=text_info.text_value)
 
-def load_next_id():
+def load_next_id(design):
     global dialog_next_id_
-    design: adsk.fusion.Design = app_.activeProduct
     next_id_attr = design.attributes.itemByName(ATTRIBUTE_GROUP, 'nextId')
     if next_id_attr:
         if next_id_attr.value is None or next_id_attr.value == 'None':
@@ -1074,45 +1204,56 @@ def load_next_id():
     print(f"{NAME} LOAD NEXT ID {dialog_next_id_}")
 
 class TextInfo:
+    __slots__ = ('sketch_texts', 'text_value')
+
     def __init__(self):
         self.sketch_texts = []
         self.text_value = None
 
-def get_texts():
-    design: adsk.fusion.Design = app_.activeProduct
+def get_texts(design, text_filter=None):
+    '''Loads the texts of the design.
 
+    If a text filter is given, only texts that match the filter are loaded.
+    '''
     texts = defaultdict(TextInfo)
 
-    value_attrs = [attr for attr in design.attributes.itemsByGroup(ATTRIBUTE_GROUP)
-                  if attr.name.startswith('textValue_')]
-    for value_attr in value_attrs:
-        if not value_attr:
+    for value_attr in design.attributes.itemsByGroup(ATTRIBUTE_GROUP):
+        if not value_attr or not value_attr.name.startswith('textValue_'):
+            continue
+        text_value = value_attr.value
+        if not text_matches_filter(text_value, text_filter):
             continue
         text_id = get_text_id(value_attr.name)
         text_info = texts[text_id]
-        text_info.text_value = value_attr.value
-
-        # Get all sketch texts belonging to the attribute
-        has_attrs = design.findAttributes(ATTRIBUTE_GROUP, f'hasText_{text_id}')
-        for has_attr in has_attrs:
-            sketch_texts = text_info.sketch_texts
-            if has_attr.parent:
-                sketch_texts.append(has_attr.parent)        
-            if has_attr.otherParents:
-                for other_parent in has_attr.otherParents:
-                    sketch_texts.append(other_parent)
-    
+        text_info.text_value = text_value
+
+    if not texts:
+        return texts
+
+    # Get all sketch texts belonging to the texts, using one search for all
+    # texts, instead of one search per text.
+    for has_attr in find_has_text_attributes(design):
+        text_info = texts.get(get_text_id(has_attr.name))
+        if not text_info:
+            # Sketch text is mapped to a text that has no value
+            continue
+        sketch_texts = text_info.sketch_texts
+        if has_attr.parent:
+            sketch_texts.append(has_attr.parent)
+        if has_attr.otherParents:
+            for other_parent in has_attr.otherParents:
+                sketch_texts.append(other_parent)
+
     return texts
 
 def document_opened_handler(args: adsk.core.DocumentEventArgs):
     if is_design_workspace():
-        check_storage_version()
+        check_storage_version(app_.activeProduct)
 
 def is_design_workspace():
     return ui_.activeWorkspace.id == 'FusionSolidEnvironment'
 
-def check_storage_version():
-    design: adsk.fusion.Design = app_.activeProduct
+def check_storage_version(design):
     storage_version_attr = design.attributes.itemByName(ATTRIBUTE_GROUP, 'storageVersion')
     if storage_version_attr:
         file_db_version = int(storage_version_attr.value)
@@ -1188,7 +1329,7 @@ def migrate_cmd_execute_handler(args: adsk.core.CommandEventArgs):
     to_version = migrate_to_
     design: adsk.fusion.Design = app_.activeProduct
     print(f'{NAME} Migrating storage: {from_version} -> {to_version}')
-    dump_storage()
+    dump_storage(design)
     if from_version == 1 and to_version == 2:
         # Migrate global attributes
         design_attrs = design.attributes.itemsByGroup(ATTRIBUTE_GROUP)
@@ -1205,23 +1346,22 @@ def migrate_cmd_execute_handler(args: adsk.core.CommandEventArgs):
 
         # The old version put the attributes on Sketch Text Proxies. The new format uses the
         # native Sketch Texts.
-        migrate_proxy_to_native_sketch('hasParametricText_', 'hasText_')
+        migrate_proxy_to_native_sketch(design, 'hasParametricText_', 'hasText_')
 
         print(f'{NAME} writing version {to_version}')
-        save_storage_version()
+        save_storage_version(design)
     else:
         ui_.messageBox('Cannot migrate from storage version {from_version} to {to_version}!',
                        NAME_VERSION)
         disable_addin()
         return
 
-    dump_storage()
+    dump_storage(design)
     print(f'{NAME} Migration done.')
     update_texts()
     ui_.messageBox('Migration complete!')
 
-def migrate_proxy_to_native_sketch(old_attr_prefix, new_attr_prefix):
-    design: adsk.fusion.Design = app_.activeProduct
+def migrate_proxy_to_native_sketch(design, old_attr_prefix, new_attr_prefix):
     print(f'Migrating {old_attr_prefix} to {new_attr_prefix}')
     attrs = design.findAttributes(ATTRIBUTE_GROUP, r're:' + old_attr_prefix + r'\d+')
     for attr in attrs:
@@ -1244,9 +1384,7 @@ def migrate_proxy_to_native_sketch(old_attr_prefix, new_attr_prefix):
             native.attributes.add(ATTRIBUTE_GROUP, f'{new_attr_prefix}{text_id}', text)
         attr.deleteMe()
 
-def dump_storage():
-    design: adsk.fusion.Design = app_.activeProduct
-
+def dump_storage(design):
     def print_attrs(attrs):
         for attr in attrs:
             print(f'"{attr.name}", "{attr.value}", '
@@ -1282,13 +1420,18 @@ def disable_addin():
     enabled_ = False
 
 def document_saving_handler(args: adsk.core.DocumentEventArgs):
-    if ui_.activeWorkspace.id == 'FusionSolidEnvironment':
+    if is_design_workspace():
         # This cannot run async or delayed, as we must update the parameters before Fusion
         # saves the document.
         update_texts(text_filter=['_.version', '_.date'], next_version=True)
 
 def command_terminated_handler(args: adsk.core.ApplicationCommandEventArgs):
     #print(f"{NAME} terminate: {args.commandId}, reason: {args.terminationReason}")
+    if not enabled_:
+        # update_texts() would not do anything. Don't run the update command
+        # just to get an empty item in the Undo history.
+        return
+
     if args.terminationReason != adsk.core.CommandTerminationReason.CompletedTerminationReason:
         if args.terminationReason == adsk.core.CommandTerminationReason.CancelledTerminationReason and args.commandId == 'DesignConfigurationUpdateNestedRowNameCmd':
             # User renamed a configuration
@@ -1299,19 +1442,9 @@ def command_terminated_handler(args: adsk.core.ApplicationCommandEventArgs):
     # must be delayed or called through update_texts_async().
     # Also, call the async function to only get one Undo item.
 
-    if args.commandId in ['ChangeParameterCommand',
-                          'SketchEditDimensionCmdDef',
-                          'DesignConfigurationActivateRowCmd']:
-        # User (might have) changed a parameter
-        update_texts_async()
-    elif args.commandId == 'FusionPasteNewCommand':
-        # User pasted a component, that will have a new name
-        update_texts_async(text_filter=['_.component'])
-    elif args.commandId == 'FusionPropertiesCommand':  
-        # User changed component properties  
-        update_texts_async(text_filter=['_.component', '_.compdesc', '_.partnum'])
-    elif (args.commandId in ['RenameCommand',
-                             'FusionRenameTimelineEntryCommand']):
+    if args.commandId in COMMAND_TEXT_FILTERS:
+        update_texts_async(text_filter=COMMAND_TEXT_FILTERS[args.commandId])
+    elif args.commandId in RENAME_CMD_IDS:
         # User might have changed a component or sketch name
         text_filter = set()
         for selection in ui_.activeSelections:
@@ -1321,12 +1454,13 @@ def command_terminated_handler(args: adsk.core.ApplicationCommandEventArgs):
                 entity = selection.entity
             except RuntimeError:
                 continue
-            if isinstance(entity, adsk.fusion.Occurrence):
-                text_filter.add('_.component')
-            elif isinstance(entity, adsk.fusion.Sketch):
-                text_filter.add('_.sketch')
+            if entity is None:
+                continue
+            filter_value = RENAME_TEXT_FILTERS.get(entity.objectType)
+            if filter_value:
+                text_filter.add(filter_value)
         if text_filter:
-            update_texts_async(text_filter=['_.component', '_.sketch'])
+            update_texts_async(text_filter=list(text_filter))
 
 
     ### TODO: Update when user selects "Compute All"
@@ -1334,34 +1468,51 @@ def command_terminated_handler(args: adsk.core.ApplicationCommandEventArgs):
     #    load()
     #    save()
 
+def has_texts(design):
+    '''Cheap check for if the design has any text parameters, without loading them.'''
+    # The ID counter is written as soon as the texts are saved the first time
+    return design.attributes.itemByName(ATTRIBUTE_GROUP, 'nextId') is not None
+
+def text_matches_filter(text, text_filter):
+    return not text_filter or any(filter_value in text for filter_value in text_filter)
+
 # NOTE: This function might be called from inside a command
 def update_texts(text_filter=None, next_version=False, texts=None):
     if not enabled_:
         return
 
+    design: adsk.fusion.Design = app_.activeProduct
+
     if not texts:
-        # No cached map of texts was provided. Let's build it.
-        texts = get_texts()
+        # No map of texts was provided. Let's build it.
+        texts = get_texts(design, text_filter)
 
     if not texts:
         # There are no texts in this document. Skip all processing.
         return
 
+    context = EvaluationContext(design, next_version)
     update_count = 0
     for text_id, text_info in texts.items():
         text = text_info.text_value
-        if not text_filter or [filter_value for filter_value in text_filter if filter_value in text]:
+        if text_matches_filter(text, text_filter):
+            # Must evaluate for every sketch for every text, in case
+            # the user has used the component name parameter.
+            # Other texts give the same result for all sketch texts.
+            sketch_dependent = any(field in text for field in SKETCH_TEXT_FIELDS)
+            evaluated_text = None
             for sketch_text in text_info.sketch_texts:
-                # Must evaluate for every sketch for every text, in case
-                # the user has used the component name parameter.
-                text_updated = set_sketch_text(sketch_text, evaluate_text(text, sketch_text, next_version))
+                if sketch_dependent or evaluated_text is None:
+                    evaluated_text = evaluate_text(text, sketch_text, context)
+                text_updated = set_sketch_text(sketch_text, evaluated_text)
                 if text_updated:
                     update_count += 1
 
-    design: adsk.fusion.Design = app_.activeProduct
+    if update_count == 0:
+        return
+
     # It is illegal to do "Compute All" in a non-parametric design.
-    if (update_count > 0 and
-        design.designType == adsk.fusion.DesignTypes.ParametricDesignType and
+    if (design.designType == adsk.fusion.DesignTypes.ParametricDesignType and
         settings_[AUTOCOMPUTE_SETTING]):
         try:
             design.computeAll()
@@ -1375,16 +1526,48 @@ def update_texts(text_filter=None, next_version=False, texts=None):
             else:
                 raise
 
-async_update_queue_ = queue.Queue()
+# Only accessed from the main thread, so no locking is needed
+async_update_queue_ = deque()
+# Set while an update command has been requested but not yet created
+update_cmd_pending_ = False
 def update_texts_async(text_filter=None, next_version=False):
     # Running this as a command to avoid a big list of "Set attribute" in the Undo history.
     # We cannot avoid having at least one item in the Undo list:
     # https://forums.autodesk.com/t5/fusion-360-api-and-scripts/stop-custom-graphics-from-being-added-to-undo/m-p/9438477
-    async_update_queue_.put((text_filter, next_version))
-    update_cmd_def = ui_.commandDefinitions.itemById(UPDATE_CMD_ID)
-    update_cmd_def.execute()
+    if not has_texts(app_.activeProduct):
+        # Nothing to update. Don't run the command just to add an empty Undo item.
+        return
+
+    global update_cmd_pending_
+    if update_cmd_pending_ and async_update_queue_:
+        # An update command is already on its way. Merge into its request instead
+        # of running one more command (and getting one more Undo item).
+        queued_filter, queued_next_version = async_update_queue_[-1]
+        if queued_next_version == next_version:
+            if not queued_filter or not text_filter:
+                # Update all texts
+                merged_filter = None
+            else:
+                merged_filter = list(set(queued_filter) | set(text_filter))
+            async_update_queue_[-1] = (merged_filter, next_version)
+            return
+
+    async_update_queue_.append((text_filter, next_version))
+    update_cmd_pending_ = True
+    executed = False
+    try:
+        executed = update_cmd_def_.execute()
+    finally:
+        if not executed:
+            # No command is on its way. Don't let later requests merge into
+            # this one. The request is handled by the next command that runs.
+            update_cmd_pending_ = False
 
 def update_cmd_created_handler(args: adsk.core.CommandCreatedEventArgs):
+    global update_cmd_pending_
+    # Later requests must run a new command, as this one might already have
+    # drained the queue when they arrive
+    update_cmd_pending_ = False
     cmd = args.command
     events_manager_.add_handler(cmd.execute, callback=update_cmd_execute_handler)
     cmd.isAutoExecute = True
@@ -1394,7 +1577,11 @@ def update_cmd_created_handler(args: adsk.core.CommandCreatedEventArgs):
     # Check migration result
 
 def update_cmd_execute_handler(args: adsk.core.CommandEventArgs):
-    update_texts(*async_update_queue_.get())
+    global update_cmd_pending_
+    update_cmd_pending_ = False
+    # Handle all queued requests, in case an earlier command never executed
+    while async_update_queue_:
+        update_texts(*async_update_queue_.popleft())
 
 error_notification_msg_ = None
 def show_error_notification(msg):
@@ -1409,8 +1596,7 @@ def show_error_notification(msg):
     global error_notification_msg_
     error_notification_msg_ = msg
 
-    error_cmd_def = ui_.commandDefinitions.itemById(ERROR_CMD_ID)
-    error_cmd_def.execute()
+    error_cmd_def_.execute()
 
 def error_cmd_created_handler(args: adsk.core.CommandCreatedEventArgs):
     cmd = args.command
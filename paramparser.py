@@ -21,6 +21,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import functools
 import re
 
 # <var>[.<member>][<slice range>][:<format>]
@@ -33,7 +34,9 @@ class ParamSpec:
         self.slice = string_slice
         self.format = format
 
+    # The same few parameter strings are parsed on every text update
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def from_string(string):
         m = PARAM_COMPONENT_PATTERN.match(string)
         if not m:
@@ -82,5 +82,11 @@ class ParamParseTest(unittest.TestCase):
         for bad in bad_strings:
             self.assertIsNone(ParamSpec.from_string(bad), msg=f'Input: {repr(bad)}')
 
+    def test_repeated_parse(self):
+        ParamSpec.from_string('_.file[2:4]:02')
+        hits = ParamSpec.from_string.cache_info().hits
+        ParamSpec.from_string('_.file[2:4]:02')
+        self.assertEqual(ParamSpec.from_string.cache_info().hits, hits + 1)
+
 if __name__ == '__main__':
     unittest.main()